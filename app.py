@@ -5,14 +5,15 @@ import tempfile
 import os
 import math
 import librosa
+import numpy as np
 
 from config import Config
 from src.utils import list_files, safe_makedirs
-from src.database import build_db, save_db, load_db, entry_to_rep
+from src.database import build_db, save_db, load_db
 from src.midi_io import extract_melody_notes
-from src.melody_repr import notes_to_rep
-from src.similarity import dp_distance
-from src.audio_query import wav_to_melody_rep, audio_window_to_rep
+from src.melody_repr import notes_to_rep, log_ioi
+from src.similarity import scan_db, avg_pitch
+from src.audio_query import wav_to_melody_rep, load_audio_window, estimate_f0_yin, audio_frames_to_rep
 
 # -------------------------------
 # Streamlit page config & style
@@ -45,6 +46,19 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# -------------------------------
+# Warm up numba kernels & librosa once per server process
+# -------------------------------
+@st.cache_resource
+def _warmup():
+    z_i8 = np.zeros(16, dtype=np.int8)
+    z_f4 = np.ones(16, dtype=np.float32)
+    scan_db(z_i8, z_i8, z_f4, None, z_i8, z_i8, z_f4, np.array([0, 16], dtype=np.int64), np.zeros(1))
+    estimate_f0_yin(np.zeros(8192, dtype=np.float32), sr=16000)
+    return True
+
+_warmup()
+
 # -------------------------------
 # App title & uploader at the top
 # -------------------------------
@@ -76,6 +90,11 @@ cfg = Config()
 # -------------------------------
 # Auto-build or load database
 # -------------------------------
+@st.cache_resource(max_entries=1)
+def _cached_load_db(path, mtime):
+    # mtime is part of the cache key so a rebuilt DB file is picked up
+    return load_db(path)
+
 db = None
 if not os.path.exists(cfg.db_out):
     st.info("Database not found. Building automatically...")
@@ -90,15 +109,17 @@ if not os.path.exists(cfg.db_out):
             save_db(db, cfg.db_out)
         st.success(f"Database built! {len(db)} songs saved.")
 else:
-    db = load_db(cfg.db_out)
+    db = _cached_load_db(cfg.db_out, os.path.getmtime(cfg.db_out))
     st.info(f"Database loaded with {len(db)} songs.")
 
 # -------------------------------
 # Melody search function
 # -------------------------------
 def find_windowed_matches(audio_path, db, win, hop, max_sec, topk):
-    duration = librosa.get_duration(path=audio_path)
-    duration = min(duration, max_sec)
+    # Decode + pitch-track the whole clip once; windows just slice the frames.
+    y_full, sr = load_audio_window(audio_path, sr=16000, start_s=0.0, dur_s=max_sec)
+    track_full = estimate_f0_yin(y_full, sr=sr)
+    duration = librosa.get_duration(y=y_full, sr=sr)
 
     starts = []
     s = 0.0
@@ -108,33 +129,40 @@ def find_windowed_matches(audio_path, db, win, hop, max_sec, topk):
     if not starts:
         starts = [0.0]
 
-    best_score = {entry.song_id: float("inf") for entry in db}
-    best_cost  = {entry.song_id: float("inf") for entry in db}
-    best_start = {entry.song_id: None for entry in db}
-    best_len   = {entry.song_id: 0 for entry in db}
+    n_songs = len(db)
+    best_score = np.full(n_songs, np.inf)
+    best_cost  = np.full(n_songs, np.inf)
+    best_start = [None] * n_songs
+    best_len   = np.zeros(n_songs, dtype=int)
     usable = 0
 
     for start_s in starts:
-        q_rep = audio_window_to_rep(audio_path, start_s=start_s, dur_s=win, sr=16000)
+        start_f, end_f = np.searchsorted(track_full.times, [start_s, start_s + win])
+        q_rep = audio_frames_to_rep(track_full, start_f, end_f)
         L = len(q_rep.intervals)
         if L < 12:
             continue
         usable += 1
-        for entry in db:
-            sid = entry.song_id
-            s_rep = entry_to_rep(entry)
-            res = dp_distance(q_rep, s_rep)
-            score = res.cost / math.sqrt(L)
-            if score < best_score[sid]:
-                best_score[sid] = score
-                best_cost[sid] = res.cost
-                best_start[sid] = start_s
-                best_len[sid] = L
+        q_I = np.asarray(q_rep.intervals, dtype=np.int8)
+        q_C = np.asarray(q_rep.contour, dtype=np.int8)
+        q_L = log_ioi(q_rep.ioi)
+        # A song whose score can't beat the current top-k cutoff can't change the
+        # returned ranking, so let the DP abandon it early.
+        kth_score = np.partition(best_score, topk - 1)[topk - 1] if topk <= n_songs else np.inf
+        costs = scan_db(q_I, q_C, q_L, avg_pitch(q_rep.pitches),
+                        db.intervals, db.contour, db.log_ioi, db.offsets, db.avg_pitches,
+                        limit=kth_score * math.sqrt(L))
+        scores = costs / math.sqrt(L)
+        for k in np.flatnonzero(scores < best_score):
+            best_score[k] = scores[k]
+            best_cost[k] = costs[k]
+            best_start[k] = start_s
+            best_len[k] = L
 
     ranked = []
-    for sid in best_score:
-        similarity = max(0.0, 1.0 - best_score[sid] / 5.0) * 100
-        ranked.append((similarity, sid, best_cost[sid], best_len[sid], best_start[sid]))
+    for k, sid in enumerate(db.ids):
+        similarity = max(0.0, 1.0 - float(best_score[k]) / 5.0) * 100
+        ranked.append((similarity, sid, float(best_cost[k]), int(best_len[k]), best_start[k]))
 
     ranked.sort(reverse=True, key=lambda x: x[0])
     return ranked[:topk], len(starts), usable
@@ -3,7 +3,7 @@ from dataclasses import dataclass
 @dataclass(frozen=True)
 class Config:
     midi_dir: str = "data/midi_songs"
-    db_out: str = "data/db/melody_db.json"
+    db_out: str = "data/db/melody_db.npz"
 
     # MIDI melody track selection heuristic
     # (you can improve later or manually override per-song)
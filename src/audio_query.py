@@ -2,7 +2,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 import numpy as np
 import librosa
-from scipy.ndimage import median_filter
+from numba import njit
 
 from .midi_io import NoteEvent
 from .melody_repr import notes_to_rep, MelodyRep
@@ -19,31 +19,58 @@ def load_audio_window(path: str, sr: int = 16000, start_s: float = 0.0, dur_s: f
     Load a window of audio [start_s, start_s+dur_s].
     """
     y, sr = librosa.load(path, sr=sr, mono=True, offset=float(start_s), duration=float(dur_s))
+    y = y.astype(np.float32, copy=False)
     peak = np.max(np.abs(y)) + 1e-9
-    y = y / peak
+    y = y / np.float32(peak)
     return y, sr
 
 
+@njit(cache=True)
+def voice_and_median(f0: np.ndarray, rms: np.ndarray, thr: float, out: np.ndarray) -> None:
+    """
+    Fused voicing gate + 7-frame median filter in one pass:
+    out[i] = median of (f0 if rms > thr else 0) over frames i-3..i+3,
+    with mirrored edges (same as scipy.ndimage.median_filter's 'reflect').
+    """
+    T = f0.shape[0]
+    buf = np.empty(7, dtype=out.dtype)
+    for i in range(T):
+        # insertion-sort the 7-frame window into buf
+        for w in range(7):
+            k = i + w - 3
+            while k < 0 or k >= T:
+                k = -k - 1 if k < 0 else 2 * T - k - 1
+            v = f0[k] if rms[k] > thr else 0.0
+            p = w
+            while p > 0 and buf[p - 1] > v:
+                buf[p] = buf[p - 1]
+                p -= 1
+            buf[p] = v
+        out[i] = buf[3]
+
+
 def estimate_f0_yin(y: np.ndarray, sr: int,
                     fmin: float = 80.0, fmax: float = 500.0,
                     frame_length: int = 2048, hop_length: int = 256) -> PitchTrack:
     """
     DSP pitch tracking using YIN (no ML).
+    Works in float32 on unpadded frames (center=False); times are frame centers.
     """
+    y = y.astype(np.float32, copy=False)
+    if len(y) < frame_length:
+        y = np.pad(y, (0, frame_length - len(y)))
     f0 = librosa.yin(
         y, fmin=fmin, fmax=fmax, sr=sr,
-        frame_length=frame_length, hop_length=hop_length
-    )
+        frame_length=frame_length, hop_length=hop_length, center=False
+    ).astype(np.float32)
     times = librosa.frames_to_time(np.arange(len(f0)), sr=sr, hop_length=hop_length)
+    times = times + 0.5 * frame_length / sr
 
-    # Simple voicing via RMS threshold
-    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+    # Simple voicing via RMS threshold, then smooth spikes (one fused pass)
+    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length, center=False)[0]
     thr = np.percentile(rms, 35)
-    voiced = rms > thr
-    f0 = np.where(voiced, f0, 0.0)
-
-    # Smooth spikes
-    f0_s = median_filter(f0, size=7)
+    f0_s = np.empty_like(f0)
+    voice_and_median(f0, rms, thr, f0_s)
     return PitchTrack(times=times, f0=f0_s)
 
 
@@ -132,13 +159,24 @@ def audio_window_to_rep(path: str, start_s: float, dur_s: float = 12.0, sr: int
     return rep
 
 
+def audio_frames_to_rep(track: PitchTrack, start_frame: int, end_frame: int) -> MelodyRep:
+    """
+    MelodyRep of frames [start_frame, end_frame) of a precomputed pitch track.
+    Lets windowed search run YIN once over the whole file and slice per window.
+    """
+    window = PitchTrack(times=track.times[start_frame:end_frame], f0=track.f0[start_frame:end_frame])
+    notes = segment_notes_from_f0(window, min_note_dur_s=0.12, cents_change=70.0)
+    return notes_to_rep(notes)
+
+
 def wav_to_melody_rep(path: str, sr: int = 16000) -> MelodyRep:
     """
     Single-shot (better for short clips). For long clips use windowed search.
     """
     y, sr = librosa.load(path, sr=sr, mono=True)
+    y = y.astype(np.float32, copy=False)
     peak = np.max(np.abs(y)) + 1e-9
-    y = y / peak
+    y = y / np.float32(peak)
     track = estimate_f0_yin(y, sr=sr)
     notes = segment_notes_from_f0(track, min_note_dur_s=0.12, cents_change=70.0)
     return notes_to_rep(notes)
@@ -150,7 +188,7 @@ def get_window_rep_debug(path: str, start_s: float, dur_s: float = 12.0) -> dict
         "start_s": start_s,
         "dur_s": dur_s,
         "n_intervals": len(rep.intervals),
-        "intervals": rep.intervals[:80],
-        "contour": rep.contour[:80],
-        "ioi": [round(x, 3) for x in rep.ioi[:80]],
+        "intervals": rep.intervals[:80].tolist(),
+        "contour": rep.contour[:80].tolist(),
+        "ioi": [round(x, 3) for x in rep.ioi[:80].tolist()],
     }
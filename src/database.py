@@ -1,85 +1,191 @@
 from __future__ import annotations
 import json
-from dataclasses import dataclass
-from typing import List, Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+import numpy as np
 from tqdm import tqdm
 
-from .midi_io import extract_melody_notes
-from .melody_repr import notes_to_rep, MelodyRep
+from .midi_io import extract_melody_notes_fast
+from .melody_repr import notes_to_rep, MelodyRep, log_ioi
 
 
 @dataclass
 class SongEntry:
     song_id: str
     midi_path: str
-    pitches: List[int]
-    intervals: List[int]
-    contour: List[int]
-    ioi: List[float]
+    pitches: np.ndarray    # int16
+    intervals: np.ndarray  # int8
+    contour: np.ndarray    # int8
+    ioi: np.ndarray        # float32
+
+
+@dataclass
+class MelodyDB:
+    """
+    Struct-of-arrays melody DB (CSR-style): song k owns
+    intervals/contour/ioi[offsets[k]:offsets[k+1]] and pitches[p_offsets[k]:p_offsets[k+1]].
+    """
+    ids: list[str]
+    midi_paths: list[str]
+    pitches: np.ndarray      # int16
+    intervals: np.ndarray    # int8
+    contour: np.ndarray      # int8
+    ioi: np.ndarray          # float32
+    offsets: np.ndarray      # int64, len = n_songs + 1
+    p_offsets: np.ndarray    # int64, len = n_songs + 1
+    avg_pitches: np.ndarray = field(init=False)      # float64 per song, nan if no pitches
+    log_ioi: np.ndarray = field(init=False)          # float32, log of ioi (DP timing term)
+
+    def __post_init__(self):
+        csum = np.concatenate([[0.0], np.cumsum(self.pitches, dtype=np.float64)])
+        counts = np.diff(self.p_offsets)
+        sums = csum[self.p_offsets[1:]] - csum[self.p_offsets[:-1]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.avg_pitches = np.where(counts > 0, sums / counts, np.nan)
+
+        self.log_ioi = log_ioi(self.ioi)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_entries(cls, entries: list[SongEntry]) -> MelodyDB:
+        def cat(values, dtype):
+            return np.concatenate([np.asarray(v, dtype=dtype) for v in values] or [np.empty(0, dtype)])
+
+        return cls(
+            ids=[e.song_id for e in entries],
+            midi_paths=[e.midi_path for e in entries],
+            pitches=cat((e.pitches for e in entries), np.int16),
+            intervals=cat((e.intervals for e in entries), np.int8),
+            contour=cat((e.contour for e in entries), np.int8),
+            ioi=cat((e.ioi for e in entries), np.float32),
+            offsets=np.cumsum([0] + [len(e.intervals) for e in entries]).astype(np.int64),
+            p_offsets=np.cumsum([0] + [len(e.pitches) for e in entries]).astype(np.int64),
+        )
+
+    def song_rep(self, k: int) -> MelodyRep:
+        a, b = self.offsets[k], self.offsets[k + 1]
+        return MelodyRep(
+            pitches=self.pitches[self.p_offsets[k]:self.p_offsets[k + 1]],
+            intervals=self.intervals[a:b],
+            contour=self.contour[a:b],
+            ioi=self.ioi[a:b],
+        )
+
+
+def _process_one(path: str, min_note_duration_s: float) -> Tuple[Optional[SongEntry], Optional[str]]:
+    """
+    Extract one MIDI's melody; returns (entry, None) or (None, reason it was skipped).
+    Runs in a worker process, so it must stay a picklable module-level function.
+    """
+    try:
+        notes = extract_melody_notes_fast(path, min_note_duration_s=min_note_duration_s)
+        rep = notes_to_rep(notes)
+
+        # Skip empty melodies (can happen if no valid melody track found)
+        if len(rep.intervals) < 2:
+            return None, "No usable melody extracted (too few notes/intervals)."
+
+        song_id = path.split("/")[-1].rsplit(".", 1)[0]
+        return SongEntry(
+            song_id=song_id,
+            midi_path=path,
+            pitches=rep.pitches,
+            intervals=rep.intervals,
+            contour=rep.contour,
+            ioi=rep.ioi,
+        ), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
 
 
 def build_db(
     midi_paths: list[str],
     min_note_duration_s: float,
     bad_log_path: str = "data/db/bad_midis.txt",
-) -> list[SongEntry]:
+    max_workers: int | None = None,
+) -> MelodyDB:
     """
     Build DB but skip corrupted / unreadable MIDI files.
     Writes skipped file paths + error messages to bad_log_path.
+    MIDIs are parsed in parallel across max_workers processes (default: all cores);
+    the DB keeps the order of midi_paths.
     """
-    db: list[SongEntry] = []
-    bad: list[Tuple[str, str]] = []
-
-    for path in tqdm(midi_paths, desc="Building melody DB"):
-        try:
-            notes = extract_melody_notes(path, min_note_duration_s=min_note_duration_s)
-            rep = notes_to_rep(notes)
-
-            # Skip empty melodies (can happen if no valid melody track found)
-            if len(rep.intervals) < 2:
-                bad.append((path, "No usable melody extracted (too few notes/intervals)."))
-                continue
-
-            song_id = path.split("/")[-1].rsplit(".", 1)[0]
-            db.append(SongEntry(
-                song_id=song_id,
-                midi_path=path,
-                pitches=rep.pitches,
-                intervals=rep.intervals,
-                contour=rep.contour,
-                ioi=rep.ioi,
-            ))
-        except Exception as e:
-            bad.append((path, f"{type(e).__name__}: {e}"))
-            continue
+    results: list[Tuple[Optional[SongEntry], Optional[str]]] = [(None, None)] * len(midi_paths)
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as ex:
+        futs = {ex.submit(_process_one, p, min_note_duration_s): k for k, p in enumerate(midi_paths)}
+        for fut in tqdm(as_completed(futs), total=len(futs), desc="Building melody DB"):
+            results[futs[fut]] = fut.result()
+
+    db: list[SongEntry] = [entry for entry, _ in results if entry is not None]
+    bad: list[Tuple[str, str]] = [(p, err) for p, (_, err) in zip(midi_paths, results) if err is not None]
 
     # Write bad MIDI log
     if bad_log_path:
-        import os
         os.makedirs(os.path.dirname(bad_log_path), exist_ok=True)
         with open(bad_log_path, "w", encoding="utf-8") as f:
             for p, msg in bad:
                 f.write(f"{p}\t{msg}\n")
 
-    return db
+    return MelodyDB.from_entries(db)
 
 
-def save_db(db: list[SongEntry], out_path: str) -> None:
-    payload = [entry.__dict__ for entry in db]
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-
-
-def load_db(path: str) -> list[SongEntry]:
-    with open(path, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-    return [SongEntry(**x) for x in payload]
-
-
-def entry_to_rep(entry: SongEntry) -> MelodyRep:
-    return MelodyRep(
-        pitches=entry.pitches,
-        intervals=entry.intervals,
-        contour=entry.contour,
-        ioi=entry.ioi
-    )
+def save_db(db: MelodyDB, out_path: str) -> None:
+    """
+    Persist the DB as a compressed .npz of its concatenated arrays + CSR offsets.
+    A path ending in .json writes the legacy JSON list of SongEntry instead (see load_db).
+    """
+    if out_path.endswith(".json"):
+        payload = []
+        for k in range(len(db)):
+            rep = db.song_rep(k)
+            payload.append({
+                "song_id": db.ids[k],
+                "midi_path": db.midi_paths[k],
+                "pitches": rep.pitches.tolist(),
+                "intervals": rep.intervals.tolist(),
+                "contour": rep.contour.tolist(),
+                "ioi": rep.ioi.tolist(),
+            })
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        return
+
+    with open(out_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            P=db.pitches,
+            I=db.intervals,
+            C=db.contour,
+            T=db.ioi,
+            offsets=db.offsets,
+            p_offsets=db.p_offsets,
+            ids=np.array(db.ids, dtype=str),
+            paths=np.array(db.midi_paths, dtype=str),
+        )
+
+
+def load_db(path: str) -> MelodyDB:
+    """
+    Load a DB written by save_db (a legacy .json list of SongEntry is also accepted).
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        return MelodyDB.from_entries([SongEntry(**x) for x in payload])
+
+    with np.load(path, allow_pickle=False) as z:
+        return MelodyDB(
+            ids=z["ids"].tolist(),
+            midi_paths=z["paths"].tolist(),
+            pitches=z["P"],
+            intervals=z["I"],
+            contour=z["C"],
+            ioi=z["T"],
+            offsets=z["offsets"],
+            p_offsets=z["p_offsets"],
+        )
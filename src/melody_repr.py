@@ -1,15 +1,15 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List
+import numpy as np
 from .midi_io import NoteEvent
 
 
 @dataclass
 class MelodyRep:
-    pitches: List[int]     # per-note MIDI pitches (length = #notes)
-    intervals: List[int]   # coarse symbols in [-4..+4] (length = #notes-1)
-    contour: List[int]     # -1 down, 0 same, +1 up (length = #notes-1)
-    ioi: List[float]       # inter-onset intervals seconds (length = #notes-1)
+    pitches: np.ndarray    # int16 per-note MIDI pitches (length = #notes)
+    intervals: np.ndarray  # int8 coarse symbols in [-4..+4] (length = #notes-1)
+    contour: np.ndarray    # int8 -1 down, 0 same, +1 up (length = #notes-1)
+    ioi: np.ndarray        # float32 inter-onset intervals seconds (length = #notes-1)
 
 
 def bin_interval_semitones(semi: int) -> int:
@@ -38,26 +38,30 @@ def bin_interval_semitones(semi: int) -> int:
     return 0
 
 
-def _contour_from_semitones(semi: int) -> int:
-    if semi > 0:
-        return 1
-    if semi < 0:
-        return -1
-    return 0
+def log_ioi(ioi: np.ndarray) -> np.ndarray:
+    """
+    float32 log of inter-onset intervals (clamped to 1e-6 s); the DP's timing
+    term compares differences of these instead of taking logs per cell.
+    """
+    return np.log(np.maximum(np.asarray(ioi, dtype=np.float32), 1e-6)).astype(np.float32)
+
+
+# bin_interval_semitones as a lookup table indexed by clip(semi, -7, 7) + 7
+_BIN_LUT = np.array([-4, -3, -3, -2, -2, -1, -1, 0, 1, 1, 2, 2, 3, 3, 4], dtype=np.int8)
 
 
 def notes_to_rep(notes: list[NoteEvent]) -> MelodyRep:
+    pitches = np.fromiter((n.pitch for n in notes), dtype=np.int16, count=len(notes))
     if len(notes) < 2:
-        pitches = [n.pitch for n in notes]
-        return MelodyRep(pitches=pitches, intervals=[], contour=[], ioi=[])
+        return MelodyRep(pitches=pitches, intervals=np.empty(0, np.int8),
+                         contour=np.empty(0, np.int8), ioi=np.empty(0, np.float32))
 
-    pitches = [n.pitch for n in notes]
-    onsets = [n.onset for n in notes]
+    onsets = np.fromiter((n.onset for n in notes), dtype=np.float64, count=len(notes))
 
-    raw_intervals = [pitches[i + 1] - pitches[i] for i in range(len(pitches) - 1)]
-    intervals = [bin_interval_semitones(int(x)) for x in raw_intervals]
-    contour = [_contour_from_semitones(int(x)) for x in raw_intervals]
+    raw_intervals = np.diff(pitches)
+    intervals = _BIN_LUT[np.clip(raw_intervals, -7, 7) + 7]
+    contour = np.sign(raw_intervals).astype(np.int8)
 
-    ioi = [max(1e-6, onsets[i + 1] - onsets[i]) for i in range(len(onsets) - 1)]
+    ioi = np.maximum(np.diff(onsets), 1e-6).astype(np.float32)
 
     return MelodyRep(pitches=pitches, intervals=intervals, contour=contour, ioi=ioi)
@@ -3,6 +3,7 @@ from typing import Optional
 from dataclasses import dataclass
 import os
 import tempfile
+import numpy as np
 import mido
 import pretty_midi
 
@@ -21,17 +22,22 @@ def _remove_too_short(notes: list[pretty_midi.Note], min_dur: float) -> list[pre
             out.append(n)
     return out
 
-def _is_monophonic(notes: list[pretty_midi.Note]) -> bool:
+def _is_monophonic_arrays(starts: np.ndarray, ends: np.ndarray) -> bool:
     """Return True if no overlaps."""
-    if not notes:
-        return True
-    notes_sorted = sorted(notes, key=lambda n: (n.start, n.end))
-    last_end = notes_sorted[0].end
-    for n in notes_sorted[1:]:
-        if n.start < last_end - 1e-6:
-            return False
-        last_end = max(last_end, n.end)
-    return True
+    order = np.lexsort((ends, starts))  # sort by (start, end)
+    last_end = np.maximum.accumulate(ends[order])
+    return not bool((starts[order][1:] < last_end[:-1] - 1e-6).any())
+
+def _melody_score(pitches: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> float:
+    mono = _is_monophonic_arrays(starts, ends)
+    avg_pitch = float(pitches.mean())
+    var_pitch = float(pitches.var())
+
+    score = 0.0
+    score += 3.0 if mono else 0.0
+    score += avg_pitch / 30.0
+    score += (var_pitch ** 0.5) / 10.0
+    return score
 
 def choose_melody_instrument(pm: pretty_midi.PrettyMIDI, min_note_duration_s: float = 0.08) -> Optional[pretty_midi.Instrument]:
     """
@@ -48,15 +54,10 @@ def choose_melody_instrument(pm: pretty_midi.PrettyMIDI, min_note_duration_s: fl
         if len(notes) < 4:
             continue
 
-        mono = _is_monophonic(notes)
-        pitches = [n.pitch for n in notes]
-        avg_pitch = sum(pitches) / len(pitches)
-        var_pitch = sum((p - avg_pitch) ** 2 for p in pitches) / len(pitches)
-
-        score = 0.0
-        score += 3.0 if mono else 0.0
-        score += avg_pitch / 30.0
-        score += (var_pitch ** 0.5) / 10.0
+        pitches = np.fromiter((n.pitch for n in notes), dtype=np.int16, count=len(notes))
+        starts = np.fromiter((n.start for n in notes), dtype=np.float64, count=len(notes))
+        ends = np.fromiter((n.end for n in notes), dtype=np.float64, count=len(notes))
+        score = _melody_score(pitches, starts, ends)
 
         candidates.append((score, inst, notes))
 
@@ -126,3 +127,117 @@ def extract_melody_notes(midi_path: str, min_note_duration_s: float = 0.08) -> l
             continue
 
     return cleaned
+
+
+def _tick_scales(mid: mido.MidiFile) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Tempo map as (segment start ticks, seconds per tick), read from track 0
+    with the same rules as pretty_midi (default 120 bpm, repeats ignored).
+    """
+    ticks = [0]
+    scales = [60.0 / (120.0 * mid.ticks_per_beat)]
+    tick = 0
+    for msg in mid.tracks[0]:
+        tick += msg.time
+        if msg.type == "set_tempo":
+            scale = 60.0 / ((6e7 / msg.tempo) * mid.ticks_per_beat)
+            if tick == 0:
+                ticks, scales = [0], [scale]
+            elif scale != scales[-1]:
+                ticks.append(tick)
+                scales.append(scale)
+    return np.array(ticks, dtype=np.int64), np.array(scales, dtype=np.float64)
+
+def _ticks_to_seconds(t: np.ndarray, seg_ticks: np.ndarray, seg_scales: np.ndarray) -> np.ndarray:
+    seg_start_s = np.concatenate([[0.0], np.cumsum(np.diff(seg_ticks) * seg_scales[:-1])])
+    i = np.searchsorted(seg_ticks, t, side="right") - 1
+    return seg_start_s[i] + (t - seg_ticks[i]) * seg_scales[i]
+
+def _read_instrument_notes(mid: mido.MidiFile) -> list[tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Notes grouped like pretty_midi instruments (program, channel, track), in the
+    same order. Returns (channel, pitches, starts_s, ends_s) per instrument.
+    """
+    by_inst: dict[tuple[int, int, int], list[tuple[int, int, int]]] = {}
+    for track_idx, track in enumerate(mid.tracks):
+        open_notes: dict[tuple[int, int], list[int]] = {}
+        program = [0] * 16
+        tick = 0
+        for msg in track:
+            tick += msg.time
+            if msg.type == "program_change":
+                program[msg.channel] = msg.program
+            elif msg.type == "note_on" and msg.velocity > 0:
+                open_notes.setdefault((msg.channel, msg.note), []).append(tick)
+            elif msg.type in ("note_on", "note_off"):
+                # One note-off closes every open note of that pitch except ones
+                # started on this very tick (pretty_midi semantics).
+                key = (msg.channel, msg.note)
+                starts = open_notes.pop(key, None)
+                if starts is None:
+                    continue
+                closed = [t for t in starts if t != tick]
+                if closed:
+                    inst = by_inst.setdefault((program[msg.channel], msg.channel, track_idx), [])
+                    inst.extend((msg.note, t, tick) for t in closed)
+                    kept = [t for t in starts if t == tick]
+                    if kept:
+                        open_notes[key] = kept
+
+    seg_ticks, seg_scales = _tick_scales(mid)
+    out = []
+    for (_, channel, _), notes in by_inst.items():
+        arr = np.array(notes, dtype=np.int64)
+        out.append((
+            channel,
+            arr[:, 0].astype(np.int16),
+            _ticks_to_seconds(arr[:, 1], seg_ticks, seg_scales),
+            _ticks_to_seconds(arr[:, 2], seg_ticks, seg_scales),
+        ))
+    return out
+
+def extract_melody_notes_fast(midi_path: str, min_note_duration_s: float = 0.08) -> list[NoteEvent]:
+    """
+    extract_melody_notes without building a PrettyMIDI object: parse with mido,
+    keep per-instrument notes as NumPy arrays and run the same melody heuristic.
+    Falls back to the pretty_midi path if mido cannot read the file.
+    """
+    try:
+        try:
+            mid = mido.MidiFile(midi_path)
+        except Exception:
+            mid = mido.MidiFile(midi_path, clip=True)
+        instruments = _read_instrument_notes(mid)
+    except Exception:
+        return extract_melody_notes(midi_path, min_note_duration_s=min_note_duration_s)
+
+    best = None
+    best_score = -np.inf
+    for channel, pitches, starts, ends in instruments:
+        if channel == 9:  # drums
+            continue
+        keep = np.maximum(0.0, ends - starts) >= min_note_duration_s
+        if keep.sum() < 4:
+            continue
+        pitches, starts, ends = pitches[keep], starts[keep], ends[keep]
+        score = _melody_score(pitches, starts, ends)
+        if score > best_score:
+            best, best_score = (pitches, starts, ends), score
+
+    if best is None:
+        return []
+
+    # Same ordering + overlap policy as extract_melody_notes:
+    # by start, end, then DESCENDING pitch; keep the first of overlapping notes.
+    pitches, starts, ends = best
+    order = np.lexsort((-pitches, ends, starts))
+    cleaned: list[NoteEvent] = []
+    last_end = -1.0
+    for k in order:
+        onset = float(starts[k])
+        dur = max(0.0, float(ends[k]) - onset)
+        if onset >= last_end - 1e-6:
+            cleaned.append(NoteEvent(pitch=int(pitches[k]), onset=onset, duration=dur))
+            last_end = onset + dur
+
+    return cleaned
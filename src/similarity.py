@@ -1,7 +1,20 @@
 from __future__ import annotations
-import math
+import threading
 from dataclasses import dataclass
-from .melody_repr import MelodyRep
+import numba
+import numpy as np
+from numba import njit, prange
+from .melody_repr import MelodyRep, log_ioi
+
+# Streamlit runs each session's script in its own thread. Parallel kernel launches
+# are serialized (the workqueue layer aborts on concurrent use), and OpenMP is tried
+# first since TBB can hang interpreter exit after a launch from a non-main thread.
+numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+_SCAN_LOCK = threading.Lock()
+
+
+INF = 1e18
+_LOG_EPS = float(np.log(1e-6))  # floor for log IOI ratios
 
 
 @dataclass
@@ -10,100 +23,197 @@ class MatchResult:
     end_j: int
 
 
-def _interval_cost(a: int, b: int) -> float:
-    return abs(a - b) / 8.0  # normalize on [-4..+4]
-
-
-def _contour_cost(a: int, b: int) -> float:
-    return 0.0 if a == b else 1.0
-
-
-def _timing_ratio_cost(q_prev: float, q: float, s_prev: float, s: float) -> float:
-    rq = q / max(1e-6, q_prev)
-    rs = s / max(1e-6, s_prev)
-    return abs(math.log(max(1e-6, rq)) - math.log(max(1e-6, rs)))
-
-
-def dp_distance(
-    query: MelodyRep,
-    song: MelodyRep,
-    w_int: float = 1.0,
-    w_cont: float = 0.7,
-    w_time: float = 0.15,
-    w_abs: float = 0.2,     # NEW: absolute pitch tie-breaker
-    ins_cost: float = 0.8,
-    del_cost: float = 0.8,
-) -> MatchResult:
+@njit(
+    "f4(i1[::1], i1[::1], f4[::1], i1[::1], i1[::1], f4[::1], f4[:, ::1], f8, f8, f8, f8, f8, f8)",
+    cache=True, fastmath=True,
+)
+def dp_distance_nb(QI, QC, QL, SI, SC, SL, D, limit, w_int, w_cont, w_time, ins_cost, del_cost):
     """
-    DP alignment on interval+contour(+timing), with optional absolute pitch penalty.
-    Lower is better.
+    Compiled DP kernel behind dp_distance (same recurrence, cost helpers inlined).
+    D is caller-owned float32 scratch of shape >= (3, n+1): the DP only needs rows
+    i-1 and i-2, so row i is kept in D[i % 3] (the last row in D[m % 3]).
+    Returns the best subsequence cost, or INF if either side is empty or the cost
+    provably exceeds `limit` (the DP then stops early).
     """
-    QI, QC, QT = query.intervals, query.contour, query.ioi
-    SI, SC, ST = song.intervals, song.contour, song.ioi
-
-    m = len(QI)
-    n = len(SI)
+    m = QI.shape[0]
+    n = SI.shape[0]
     if m == 0 or n == 0:
-        return MatchResult(cost=float("inf"), end_j=-1)
-
-    INF = 1e18
-    D = [[INF] * (n + 1) for _ in range(m + 1)]
+        return INF
 
     # subsequence: start anywhere in song at zero cost for i=0
     for j in range(n + 1):
-        D[0][j] = 0.0
-
-    def local(i: int, j: int) -> float:
-        ic = _interval_cost(QI[i - 1], SI[j - 1])
-        cc = _contour_cost(QC[i - 1], SC[j - 1])
-        tc = 0.0
-        if i >= 2 and j >= 2:
-            tc = _timing_ratio_cost(QT[i - 2], QT[i - 1], ST[j - 2], ST[j - 1])
-        return w_int * ic + w_cont * cc + w_time * tc
+        D[0, j] = 0.0
 
+    prev_row_min = 0.0
     for i in range(1, m + 1):
+        # per-row query terms and row views, hoisted out of the j loop
+        qi = QI[i - 1]
+        qc = QC[i - 1]
+        lq = max(_LOG_EPS, QL[i - 1] - QL[i - 2]) if i >= 2 else 0.0
+        merged_q = max(-4, min(4, QI[i - 2] + qi)) if i >= 2 else 0
+        D_i, D_im1, D_im2 = D[i % 3], D[(i - 1) % 3], D[(i - 2) % 3]
+
+        D_i[0] = INF
+        row_min = INF
         for j in range(1, n + 1):
-            best = INF
+            si = SI[j - 1]
+            cc = 0.0 if qc == SC[j - 1] else 1.0
 
             # match/substitute
-            best = min(best, D[i - 1][j - 1] + local(i, j))
+            ic = abs(qi - si) * 0.125
+            # timing: |log IOI ratio| difference, from precomputed log IOIs
+            tc = 0.0
+            if i >= 2 and j >= 2:
+                ls = max(_LOG_EPS, SL[j - 1] - SL[j - 2])
+                tc = abs(lq - ls)
+            best = D_im1[j - 1] + w_int * ic + w_cont * cc + w_time * tc
 
             # insertion/deletion
-            best = min(best, D[i - 1][j] + ins_cost)
-            best = min(best, D[i][j - 1] + del_cost)
+            best = min(best, D_im1[j] + ins_cost)
+            best = min(best, D_i[j - 1] + del_cost)
 
             # note insertion: two query intervals ~ one song interval
             if i >= 2:
-                merged_q = max(-4, min(4, QI[i - 2] + QI[i - 1]))
-                merged_c = QC[i - 1]  # simple approximation
-                ic = _interval_cost(merged_q, SI[j - 1])
-                cc = _contour_cost(merged_c, SC[j - 1])
-                best = min(best, D[i - 2][j - 1] + w_int * ic + w_cont * cc + 0.6)
+                ic = abs(merged_q - si) * 0.125
+                best = min(best, D_im2[j - 1] + w_int * ic + w_cont * cc + 0.6)
 
             # note deletion: one query interval ~ two song intervals
             if j >= 2:
-                merged_s = max(-4, min(4, SI[j - 2] + SI[j - 1]))
-                merged_c = SC[j - 1]
-                ic = _interval_cost(QI[i - 1], merged_s)
-                cc = _contour_cost(QC[i - 1], merged_c)
-                best = min(best, D[i - 1][j - 2] + w_int * ic + w_cont * cc + 0.6)
+                merged_s = max(-4, min(4, SI[j - 2] + si))
+                ic = abs(qi - merged_s) * 0.125
+                best = min(best, D_im1[j - 2] + w_int * ic + w_cont * cc + 0.6)
 
-            D[i][j] = best
+            D_i[j] = best
+            row_min = min(row_min, D_i[j])  # the stored float32 value, as returned
+
+        # Every path to row m crosses row i or row i-1 (steps advance i by at most 2)
+        # and costs never decrease, so this is a lower bound on the final cost.
+        if min(row_min, prev_row_min) > limit:
+            return INF
+        prev_row_min = row_min
 
     # best subsequence: minimum over all end positions j
     best_cost = INF
-    best_j = -1
     for j in range(1, n + 1):
-        if D[m][j] < best_cost:
-            best_cost = D[m][j]
-            best_j = j - 1
+        if D[m % 3, j] < best_cost:
+            best_cost = D[m % 3, j]
+    return best_cost
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def scan_db_nb(QI, QC, QL, all_I, all_C, all_L, offsets, limits, out_cost,
+               w_int, w_cont, w_time, ins_cost, del_cost):
+    """
+    Run dp_distance_nb of one query against every song of a concatenated
+    (CSR-style) DB in parallel: song k is all_*[offsets[k]:offsets[k+1]],
+    abandoned early (INF) once its cost must exceed limits[k].
+    """
+    for k in prange(offsets.shape[0] - 1):
+        a = offsets[k]
+        b = offsets[k + 1]
+        D = np.empty((3, b - a + 1), dtype=np.float32)
+        out_cost[k] = dp_distance_nb(QI, QC, QL, all_I[a:b], all_C[a:b], all_L[a:b], D, limits[k],
+                                     w_int, w_cont, w_time, ins_cost, del_cost)
+
+
+def scan_db(
+    QI: np.ndarray, QC: np.ndarray, QL: np.ndarray, q_avg_pitch: float | None,
+    all_I: np.ndarray, all_C: np.ndarray, all_L: np.ndarray,
+    offsets: np.ndarray, avg_pitches: np.ndarray,
+    w_int: float = 1.0,
+    w_cont: float = 0.7,
+    w_time: float = 0.15,
+    w_abs: float = 0.2,
+    ins_cost: float = 0.8,
+    del_cost: float = 0.8,
+    limit: float = np.inf,
+) -> np.ndarray:
+    """
+    dp_distance costs (abs pitch penalty included) of one query against all songs.
+    Returns float64 array of shape (n_songs,); inf where either side is empty.
+    Songs whose cost would exceed `limit` are pruned mid-DP and also reported as inf.
+    """
+    n_songs = len(offsets) - 1
+    abs_pen = np.zeros(n_songs)
+    if q_avg_pitch is not None:
+        abs_pen = w_abs * (np.abs(q_avg_pitch - avg_pitches) / 12.0)
+        abs_pen = np.nan_to_num(abs_pen, nan=0.0)  # songs without pitches get no penalty
+
+    out = np.empty(n_songs, dtype=np.float32)
+    limits = np.minimum(limit - abs_pen, INF)  # kernels are fastmath: keep limits finite
+    with _SCAN_LOCK:
+        scan_db_nb(QI, QC, QL, all_I, all_C, all_L, offsets, limits, out,
+                   w_int, w_cont, w_time, ins_cost, del_cost)
+    costs = out.astype(np.float64)
+    costs[out >= np.float32(INF)] = np.inf
+    return costs + abs_pen
+
+
+def dp_distance_arrays(
+    QI: np.ndarray, QC: np.ndarray, QL: np.ndarray, q_avg_pitch: float | None,
+    SI: np.ndarray, SC: np.ndarray, SL: np.ndarray, s_avg_pitch: float | None,
+    w_int: float = 1.0,
+    w_cont: float = 0.7,
+    w_time: float = 0.15,
+    w_abs: float = 0.2,     # NEW: absolute pitch tie-breaker
+    ins_cost: float = 0.8,
+    del_cost: float = 0.8,
+    scratch: np.ndarray | None = None,
+) -> MatchResult:
+    """
+    dp_distance on prebuilt contiguous arrays (int8 intervals/contour, float32 log IOIs).
+    Pass a float32 `scratch` of shape >= (3, n+1) to reuse it across calls.
+    """
+    m = len(QI)
+    n = len(SI)
+    if m == 0 or n == 0:
+        return MatchResult(cost=float("inf"), end_j=-1)
+
+    D = scratch
+    if D is None or D.shape[0] < 3 or D.shape[1] <= n:
+        D = np.empty((3, n + 1), dtype=np.float32)
+
+    best_cost = float(dp_distance_nb(QI, QC, QL, SI, SC, SL, D, INF,
+                                     w_int, w_cont, w_time, ins_cost, del_cost))
+    best_j = int(np.argmin(D[m % 3, 1:n + 1]))
 
     # NEW: absolute pitch tie-breaker (very light)
     # Compare average pitch level (in MIDI notes), normalize per octave.
-    if query.pitches and song.pitches:
-        avg_q = sum(query.pitches) / len(query.pitches)
-        avg_s = sum(song.pitches) / len(song.pitches)
-        abs_pen = w_abs * (abs(avg_q - avg_s) / 12.0)
+    if q_avg_pitch is not None and s_avg_pitch is not None:
+        abs_pen = w_abs * (abs(q_avg_pitch - s_avg_pitch) / 12.0)
         best_cost += abs_pen
 
     return MatchResult(cost=best_cost, end_j=best_j)
+
+
+def avg_pitch(pitches) -> float | None:
+    return float(np.mean(pitches)) if len(pitches) else None
+
+
+def dp_distance(
+    query: MelodyRep,
+    song: MelodyRep,
+    w_int: float = 1.0,
+    w_cont: float = 0.7,
+    w_time: float = 0.15,
+    w_abs: float = 0.2,     # NEW: absolute pitch tie-breaker
+    ins_cost: float = 0.8,
+    del_cost: float = 0.8,
+    scratch: np.ndarray | None = None,
+) -> MatchResult:
+    """
+    DP alignment on interval+contour(+timing), with optional absolute pitch penalty.
+    Lower is better.
+    """
+    return dp_distance_arrays(
+        np.ascontiguousarray(query.intervals, dtype=np.int8),
+        np.ascontiguousarray(query.contour, dtype=np.int8),
+        log_ioi(query.ioi),
+        avg_pitch(query.pitches),
+        np.ascontiguousarray(song.intervals, dtype=np.int8),
+        np.ascontiguousarray(song.contour, dtype=np.int8),
+        log_ioi(song.ioi),
+        avg_pitch(song.pitches),
+        w_int=w_int, w_cont=w_cont, w_time=w_time, w_abs=w_abs,
+        ins_cost=ins_cost, del_cost=del_cost, scratch=scratch,
+    )